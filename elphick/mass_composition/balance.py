@@ -12,88 +12,373 @@ as the input.  Instead, we'll apply a cost to the metal balance by each componen
 Initially we will develop for dry balancing only.
 
 """
-from functools import partial
-from typing import Optional, List, Callable, Dict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from functools import partial, cached_property
+from itertools import chain
+from typing import Optional, List, Callable, Dict, Tuple
 
 import numpy as np
 import pandas as pd
-from scipy.optimize import minimize
+from scipy.optimize import least_squares
+from scipy.sparse import csr_matrix, coo_matrix, block_diag, diags, vstack
 
 from elphick.mass_composition.mc_network import MCNetwork
 from elphick.mass_composition.mc_node import NodeType
 
 
+def cost_fn(x: np.ndarray, xm_flat: np.ndarray, inv_sd_flat: np.ndarray, n_streams: int, n_comp: int,
+            incidence: csr_matrix, buffers: Optional[Dict[str, np.ndarray]] = None) -> float:
+    """The numpy compliant cost function
+
+    The columns of xm and sd are mass_dry, h2o, followed by any chemical analytes.  Only flat arrays are
+    accepted (no DataFrames or nested lists) so the function can be bound once and called many times by the
+    optimiser with minimal overhead.
+
+    Args:
+        x: The x values as a 1d array on which to calculate cost.
+        xm_flat: The flattened (m*n) measured x values: m=streams, n=components.  Missing (nan) measurements
+         are expected to be zeroed, with a zero inv_sd_flat value.
+        inv_sd_flat: The flattened (m*n) reciprocal of the sd values: m=streams, n=components.
+        n_streams: The number of streams (m)
+        n_comp: The number of components (n)
+        incidence: The sparse signed node incidence matrix (num_nodes x m), +1 for node inputs, -1 for outputs
+        buffers: Optional work arrays created by _cost_buffers.  Supplying them avoids allocation on every call,
+         but they must not be shared between concurrent calls.
+
+    Returns:
+        The cost to be minimised
+    """
+
+    if buffers is None:
+        buffers = _cost_buffers(n_streams, n_comp)
+
+    _fill_residuals(x, xm_flat, inv_sd_flat, n_streams, n_comp, incidence, buffers)
+    resid: np.ndarray = buffers['resid']
+    imbalance: np.ndarray = buffers['imbalance'].ravel()
+    cost_mass_grades: float = float(np.dot(resid, resid))
+    cost_component_balance: float = float(np.dot(imbalance, imbalance))
+
+    return cost_mass_grades + cost_component_balance
+
+
+def _fill_residuals(x: np.ndarray, xm_flat: np.ndarray, inv_sd_flat: np.ndarray, n_streams: int, n_comp: int,
+                    incidence: csr_matrix, buffers: Dict[str, np.ndarray]):
+    """Calculate the weighted mass/grade residuals and the node component imbalance into the buffers
+
+    The arguments are the same as for cost_fn.  On return buffers['resid'] holds the (m*n) mass/grade
+    residuals, buffers['valid'] the mask of finite, non-zero x values and buffers['imbalance'] the (num_nodes x n)
+    component imbalance.
+    """
+
+    # zero and missing (nan) x values are excluded from the cost.  Only the division needs the mask; the other
+    # passes run as plain (SIMD) ufunc loops and the excluded values are zeroed afterwards.
+    resid: np.ndarray = buffers['resid']
+    valid: np.ndarray = np.isfinite(x, out=buffers['valid'])
+    np.logical_and(valid, x != 0.0, out=valid)
+    np.subtract(xm_flat, x, out=resid)
+    np.multiply(resid, inv_sd_flat, out=resid)
+    np.divide(resid, x, out=resid, where=valid)
+    np.copyto(resid, 0.0, where=~valid)
+
+    # metal balance - convert to metal mass
+    x_2d: np.ndarray = x.reshape(n_streams, n_comp)
+    # convert to mass units - first column is dry mass
+    # ignore moisture (wet basis) for now...
+    x_mass: np.ndarray = buffers['x_mass']
+    x_mass[:, 0] = x_2d[:, 0]
+    np.multiply(x_2d[:, 1:], x_2d[:, 0:1], out=x_mass[:, 1:])
+    x_mass[:, 1:] /= 100.0
+
+    # component imbalance (in - out) across every node with a single sparse-dense product, O(nnz * n)
+    imbalance: np.ndarray = incidence @ x_mass
+    np.nan_to_num(imbalance, copy=False)
+    buffers['imbalance'] = imbalance
+
+
+def residual(x: np.ndarray, xm_flat: np.ndarray, inv_sd_flat: np.ndarray, n_streams: int, n_comp: int,
+             incidence: csr_matrix, buffers: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """The residual vector, the sum of squares of which is the cost
+
+    The arguments are the same as for cost_fn.  Exposing the residuals rather than their summed cost allows
+    a least squares solver to exploit the structure of the problem.
+
+    Returns:
+        The (m*n + num_nodes*n) residuals, mass/grade residuals followed by the component imbalance
+    """
+
+    if buffers is None:
+        buffers = _cost_buffers(n_streams, n_comp)
+
+    _fill_residuals(x, xm_flat, inv_sd_flat, n_streams, n_comp, incidence, buffers)
+    return np.concatenate([buffers['resid'], buffers['imbalance'].ravel()])
+
+
+def residual_jac(x: np.ndarray, xm_flat: np.ndarray, inv_sd_flat: np.ndarray, n_streams: int, n_comp: int,
+                 incidence: csr_matrix, buffers: Optional[Dict[str, np.ndarray]] = None) -> csr_matrix:
+    """The analytic Jacobian of the residual vector
+
+    The arguments are the same as for cost_fn (buffers are unused, but accepted so the residual arguments
+    can be shared).
+
+    1) mass/grade residuals: d/dx ((xm - x) * inv_sd / x) = -inv_sd * xm / x^2, on the diagonal
+    2) component imbalance: E = incidence @ x_mass, chained through x_mass[:, 0] = x[:, 0] and
+       x_mass[:, c] = x[:, c] * x[:, 0] / 100.
+
+    The Jacobian is sparse, with the sparsity of the incidence matrix, so it scales to block diagonal
+    (many record) problems.
+
+    Returns:
+        The sparse (m*n + num_nodes*n, m*n) Jacobian
+    """
+
+    x_2d: np.ndarray = x.reshape(n_streams, n_comp)
+    valid: np.ndarray = np.isfinite(x) & (x != 0.0)
+
+    d_resid: np.ndarray = np.zeros_like(x)
+    np.divide(-inv_sd_flat * xm_flat, x * x, out=d_resid, where=valid)
+
+    b: coo_matrix = incidence.tocoo()
+    comp: np.ndarray = np.arange(n_comp)
+    scale: np.ndarray = np.ones((n_streams, n_comp))
+    scale[:, 1:] = x_2d[:, 0:1] / 100.0
+    # each component imbalance against the same component, then against the dry mass of the stream
+    rows: np.ndarray = np.concatenate([(b.row[:, None] * n_comp + comp).ravel(),
+                                       (b.row[:, None] * n_comp + comp[1:]).ravel()])
+    cols: np.ndarray = np.concatenate([(b.col[:, None] * n_comp + comp).ravel(),
+                                       np.repeat(b.col * n_comp, n_comp - 1)])
+    data: np.ndarray = np.concatenate([(b.data[:, None] * scale[b.col]).ravel(),
+                                       (b.data[:, None] * x_2d[b.col, 1:] / 100.0).ravel()])
+    # imbalances involving missing (nan) values are zeroed in the residual, so carry no gradient
+    x_mass: np.ndarray = x_2d * scale
+    finite_imbalance: np.ndarray = np.isfinite(incidence @ x_mass).ravel()
+    data[~finite_imbalance[rows]] = 0.0
+    d_imbalance: csr_matrix = csr_matrix((data, (rows, cols)), shape=(incidence.shape[0] * n_comp, x.size))
+
+    return vstack([diags(d_resid), d_imbalance], format='csr')
+
+
+def _free_residual(z: np.ndarray, x: np.ndarray, free: np.ndarray, args: Tuple) -> np.ndarray:
+    """The residual vector as a function of the free x values only, the others held at their values in x"""
+    x[free] = z
+    return residual(x, *args)
+
+
+def _free_residual_jac(z: np.ndarray, x: np.ndarray, free: np.ndarray, args: Tuple) -> np.ndarray:
+    """The Jacobian of _free_residual"""
+    x[free] = z
+    return residual_jac(x, *args)[:, np.flatnonzero(free)]
+
+
+def _solve_batch(x0: np.ndarray, args: Tuple) -> np.ndarray:
+    """Solve a (batch of records) least squares problem
+
+    Defined at module level so it can be dispatched to a process pool.
+
+    Args:
+        x0: The flattened initial x values
+        args: The cost function arguments (excluding x)
+
+    Returns:
+        The optimised x values
+    """
+
+    # the cost is a sum of squares, so solve as a least squares problem on the residual vector.
+    # zero values carry no cost and any step away from zero is a jump in cost, so they are held fixed, as are
+    # missing (nan) values, which are returned as nan.
+    # the Jacobian varies widely in scale (residuals are relative to x), so the variables are scaled by it.
+    x: np.ndarray = x0.copy()
+    free: np.ndarray = np.isfinite(x) & (x != 0.0)
+    res = least_squares(_free_residual, x[free], jac=_free_residual_jac, args=(x, free, args), method='trf',
+                        x_scale='jac')
+    x[free] = res.x
+    return x
+
+
+def _cost_buffers(n_streams: int, n_comp: int) -> Dict[str, np.ndarray]:
+    """Preallocate the work arrays used by cost_fn
+
+    Args:
+        n_streams: The number of streams
+        n_comp: The number of components
+
+    Returns:
+        Dict of work arrays keyed by name
+    """
+    return {'resid': np.empty(n_streams * n_comp),
+            'valid': np.empty(n_streams * n_comp, dtype=bool),
+            'x_mass': np.empty((n_streams, n_comp))}
+
+
+def _bound_cost_fn(x: np.ndarray, args: Tuple) -> float:
+    return cost_fn(x, *args)
+
+
+def _node_incidence(node_ins_outs: List[Tuple[List[int], List[int]]], n_streams: int) -> csr_matrix:
+    """The signed node incidence matrix
+
+    Args:
+        node_ins_outs: A list of input and output tuples of stream indexes (define node ins/outs)
+        n_streams: The number of streams
+
+    Returns:
+        Sparse matrix (num_nodes x num_streams) with +1 for node inputs and -1 for node outputs
+    """
+    # build the contiguous CSR arrays directly - each node row holds its inputs then its outputs
+    indices: np.ndarray = np.fromiter(chain.from_iterable(ins + outs for ins, outs in node_ins_outs),
+                                      dtype=np.int32)
+    data: np.ndarray = np.fromiter(chain.from_iterable([1.0] * len(ins) + [-1.0] * len(outs)
+                                                       for ins, outs in node_ins_outs), dtype=np.float64)
+    indptr: np.ndarray = np.cumsum([0] + [len(ins) + len(outs) for ins, outs in node_ins_outs], dtype=np.int32)
+    return csr_matrix((data, indices, indptr), shape=(len(node_ins_outs), n_streams))
+
+
 class MCBalance:
     def __init__(self, mcn: MCNetwork):
         self.mcn: MCNetwork = mcn
         self.sd: pd.DataFrame = self.create_balance_config(best_measurements='input')
 
-    def _create_cost_functions(self) -> Dict[str, Callable]:
-        """Cost Functions to be minimised
+    def invalidate(self):
+        """Clear the cached network data
 
-        We penalise the following:
-        1) differences between mass and absolute grades for each stream versus measured.
-        2) differences across each node for component masses (in-out)
+        The network derived data used by the cost functions is materialised once and cached.  Call this
+        method if self.mcn is modified after the object is created.  Note that self.sd is not recreated.
+        """
+        for attr in ['_df_network', '_cols', '_stream_map', '_balance_nodes', '_incidence', '_measured_array']:
+            self.__dict__.pop(attr, None)
 
-        If each record is minimised with the appropriate cost function individually we expect
-        to balance each record as well as the aggregate.
+    @cached_property
+    def _df_network(self) -> pd.DataFrame:
+        return self.mcn.to_dataframe()
+
+    @cached_property
+    def _cols(self) -> List[str]:
+        return [col for col in self._df_network.columns if col != 'mass_wet']
+
+    @cached_property
+    def _stream_map(self) -> Dict[str, int]:
+        return {n: i for i, n in enumerate(self.mcn.get_edge_names())}
+
+    @cached_property
+    def _balance_nodes(self) -> List:
+        return [n for n, mc in self.mcn.nodes(data='mc') if mc.node_type == NodeType.BALANCE]
+
+    @cached_property
+    def _incidence(self) -> csr_matrix:
+        node_ins_outs: List = []
+        for n in self._balance_nodes:
+            inputs, outputs = self.mcn.get_node_input_outputs(n)
+            node_ins_outs.append(([self._stream_map[i.name] for i in inputs],
+                                  [self._stream_map[o.name] for o in outputs]))
+        return _node_incidence(node_ins_outs, len(self._stream_map))
+
+    @cached_property
+    def _measured_array(self) -> Tuple[np.ndarray, pd.Index, pd.DataFrame]:
+        """The measured values of the network as a contiguous 3D array
+
+        The pandas work is done once here, so the per-record optimisation works with ndarrays only.
 
         Returns:
-            float which is the cost to be minimised
+            Tuple of the array (records x streams x components), the record index, and the tidy measured
+            DataFrame (mass_wet excluded) from which the array was built.
         """
+        df_measured: pd.DataFrame = self._df_network[self._cols]
+        records: pd.Index = self.mcn.get_input_edges()[0].data.to_dataframe().index
 
-        xm: pd.DataFrame = self.mcn.to_dataframe().drop(columns=['mass_wet'])
+        rec_pos, strm_pos = self._row_positions(df_measured.index, records)
+        x_measured: np.ndarray = np.full((len(records), len(self._stream_map), len(self._cols)), np.nan)
+        x_measured[rec_pos, strm_pos] = df_measured.values
+        return x_measured, records, df_measured
 
-        # xi: pd.DataFrame = df_x[[col for col in df_x.columns if col != 'mass_wet']]
-        # sd: pd.DataFrame = self.sd
+    def _row_positions(self, index: pd.MultiIndex, records: pd.Index) -> Tuple[np.ndarray, np.ndarray]:
+        """The (record, stream) positions of the rows of a tidy network DataFrame
 
-        stream_map: Dict = {n: i for i, n in enumerate(self.mcn.get_edge_names())}
-        nodes = [n for n in self.mcn.nodes.data() if n[1]['mc'].node_type == NodeType.BALANCE]
-        node_ins_outs: List = []
-        for n in nodes:
-            inputs, outputs = self.mcn.get_node_input_outputs(n[0])
-            node_ins_outs.append(([stream_map[i.name] for i in inputs], [stream_map[o.name] for o in outputs]))
+        Args:
+            index: The index of the tidy DataFrame, with the stream name as the last level
+            records: The record index
 
-        def cost_fn(x: np.ndarray, xm: np.ndarray, sd: np.ndarray, node_relationships: List) -> float:
-            """The numpy compliant cost function
+        Returns:
+            Tuple of record positions and stream positions
+        """
+        streams: pd.Index = pd.Index(list(self._stream_map.keys()))
+        record_labels: pd.Index = index.droplevel(-1)
+        stream_labels: pd.Index = index.get_level_values(-1)
+        rec_pos: np.ndarray = records.get_indexer(record_labels)
+        strm_pos: np.ndarray = streams.get_indexer(stream_labels)
+        # get_indexer marks unknown labels with -1, which would otherwise silently address the last position
+        if (rec_pos < 0).any():
+            raise KeyError(f"Records not found in the network: {list(record_labels[rec_pos < 0].unique())}")
+        if (strm_pos < 0).any():
+            raise KeyError(f"Streams not found in the network: {list(stream_labels[strm_pos < 0].unique())}")
+        return rec_pos, strm_pos
+
+    def _masked_measured(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The measured values and reciprocal sd values for every record, with missing measurements zeroed
 
-            The columns of xm and sd are mass_dry, h2o, followed by any chemical analytes
+        Returns:
+            Tuple of the measured values and the reciprocal sd values, each records x streams x components
+        """
 
-            Args:
-                x: The x values as a 1d array on which to calculate cost.
-                xm: The 2D array (mxn) of measured x values: m=streams, n=components.
-                sd: The 2D array (mxn) of sd values: m=streams, n=components.
-                node_relationships: A list of input and output tuples of stream indexes (define node ins/outs)
+        x_measured, _, _ = self._measured_array
+        # reciprocal computed once so the hot path multiplies rather than divides - a zero sd carries no cost
+        sd: np.ndarray = self.sd.values.astype(np.float64)
+        inv_sd: np.ndarray = np.divide(1.0, sd, out=np.zeros_like(sd), where=sd != 0.0)
+        # missing measurements carry no cost - resolve the mask once, not per evaluation
+        measured: np.ndarray = ~np.isnan(x_measured)
+        return np.where(measured, x_measured, 0.0), np.where(measured, inv_sd[None, :, :], 0.0)
 
-            Returns:
+    def _create_cost_args(self) -> Dict[str, Tuple]:
+        """Arguments of the cost function for each record
 
-            """
+        The arguments are positional, following x, so they can be passed directly to the optimiser
+        without wrapping the cost function.
 
-            cost_mass_grades = np.nan_to_num(((xm.ravel() - x) / (x * sd.ravel())) ** 2)
+        Returns:
+            Dict keyed by record of the tuple of cost_fn arguments (excluding x)
+        """
 
-            # metal balance - convert to metal mass
-            x_2d = x.reshape(xm.shape)
-            # convert to mass units - first column is dry mass
-            # ignore moisture (wet basis) for now...
-            x_mass = np.hstack([x_2d[:, 0].reshape(-1, 1), x_2d[:, 1:] * x_2d[:, 0].reshape(-1, 1) / 100.0])
-            cost_component_balance: List = []
-            for ins, outs in node_relationships:
-                mass_in_sum = x_mass[ins, :].sum(axis=0)
-                x_mass_node = np.nan_to_num((mass_in_sum - x_mass[outs, :].sum(axis=0)) ** 2)
-                cost_component_balance.append(x_mass_node.sum())
+        n_streams, n_comp = self.sd.shape
+        _, records, _ = self._measured_array
+        xm, inv_sd = self._masked_measured()
+        return {k: (xm[r].ravel(), inv_sd[r].ravel(), n_streams, n_comp, self._incidence,
+                    _cost_buffers(n_streams, n_comp)) for r, k in enumerate(records)}
 
-            costs = cost_mass_grades.sum() + sum(cost_component_balance)
-            return costs
+    def _create_batch_cost_args(self, record_pos: Optional[np.ndarray] = None) -> Tuple:
+        """Arguments of the cost function for a batch of records as a single problem
 
-        # create one cost function per record
-        d_fns: Dict = {}
-        df_network: pd.DataFrame = self.mcn.to_dataframe()
-        cols = [col for col in df_network.columns if col != 'mass_wet']
-        for i in self.mcn.get_input_edges()[0].data.to_dataframe().index:
-            df_x: pd.DataFrame = df_network.loc[i, :][cols]
-            d_fns[i] = partial(cost_fn, xm=df_x.values, sd=self.sd.values, node_relationships=node_ins_outs)
+        Records are independent, so stacking their streams with a block diagonal incidence matrix gives one
+        problem whose cost is the sum of the record costs.
 
-        return d_fns
+        Args:
+            record_pos: The positions of the records in the batch.  If None all records are included.
+
+        Returns:
+            The tuple of cost_fn arguments (excluding x), where x is the flattened records x streams x components
+        """
+
+        n_streams, n_comp = self.sd.shape
+        xm, inv_sd = self._masked_measured()
+        if record_pos is not None:
+            xm, inv_sd = xm[record_pos], inv_sd[record_pos]
+        n_records: int = xm.shape[0]
+        incidence: csr_matrix = block_diag([self._incidence] * n_records, format='csr')
+        return (xm.ravel(), inv_sd.ravel(), n_records * n_streams, n_comp, incidence,
+                _cost_buffers(n_records * n_streams, n_comp))
+
+    def _create_cost_functions(self) -> Dict[str, Callable]:
+        """Cost Functions to be minimised
+
+        We penalise the following:
+        1) differences between mass and absolute grades for each stream versus measured.
+        2) differences across each node for component masses (in-out)
+
+        If each record is minimised with the appropriate cost function individually we expect
+        to balance each record as well as the aggregate.
+
+        Returns:
+            Dict keyed by record of functions of x returning the cost to be minimised
+        """
+
+        return {k: partial(_bound_cost_fn, args=args) for k, args in self._create_cost_args().items()}
 
     def _get_constraints(self, x) -> Callable:
         """Prepare the constraint function
@@ -150,41 +435,47 @@ class MCBalance:
         if best_measurements:
             tight_sd: float = 0.001 if best_locked else 0.1
             if best_measurements == 'input':
-                for strm in [e.name for e in self.mcn.get_input_edges()]:
-                    df_sd.loc[strm, :] = tight_sd
+                strm_list: List[str] = [e.name for e in self.mcn.get_input_edges()]
             elif best_measurements == 'output':
-                for strm in [e.name for e in self.mcn.get_output_edges()]:
-                    df_sd.loc[strm, :] = tight_sd
+                strm_list: List[str] = [e.name for e in self.mcn.get_output_edges()]
             else:
                 raise KeyError("best_measurements argument must be 'input'|'output'")
+            df_sd.loc[strm_list, :] = tight_sd
         return df_sd
 
-        print('done')
-
-    def optimise(self) -> pd.DataFrame:
+    def optimise(self, n_jobs: int = 1, use_processes: bool = False) -> pd.DataFrame:
         """Optimise to deliver balanced mass and component masses
 
-        We'll prepare cost functions for each record in the dataset, and will iterate through them all,
-        optimising in turn.  Later we can parallelize.
+        Records are independent, so records are optimised together as a single least squares problem
+        with a block diagonal (sparse) Jacobian, rather than one solver invocation per record.  For large
+        datasets the records can be split into n_jobs batches, each solved concurrently.
+
+        Args:
+            n_jobs: The number of batches of records, each optimised concurrently.
+            use_processes: If True the batches are optimised across a pool of processes, otherwise threads.
+             Processes avoid contention for the GIL, at the cost of pickling the batch arguments.
 
         Returns:
 
         """
 
-        d_cost_fns: Dict[str, Callable] = self._create_cost_functions()
-        df_measured: pd.DataFrame = self.mcn.to_dataframe()
-        cols: List[str] = [col for col in df_measured.columns if col != 'mass_wet']
-
-        chunks: List = []
-        for k, fn in d_cost_fns.items():
-            df_x0: pd.DataFrame = df_measured.loc[k, cols]
-            res = minimize(fn, df_x0.values.ravel(), method='nelder-mead',
-                           options={'xatol': 1e-8, 'disp': True})
-            df_res: pd.DataFrame = pd.DataFrame(res.x.reshape(df_x0.shape),
-                                                index=df_x0.index, columns=df_x0.columns).assign(
-                **{df_measured.index.names[0]: k})
-            print(df_x0 - df_res)
-            chunks.append(df_res)
-        df_res: pd.DataFrame = pd.concat(chunks).reset_index().set_index(df_measured.index.names)
-        df_res = df_res.loc[df_measured.index, :]  # sort to match the input
+        x0, records, df_measured = self._measured_array
+
+        batches: List[np.ndarray] = np.array_split(np.arange(len(records)), max(min(n_jobs, len(records)), 1))
+        batch_args: List[Tuple] = [self._create_batch_cost_args(pos) for pos in batches]
+        x0_batches: List[np.ndarray] = [x0[pos].ravel() for pos in batches]
+        if len(batches) == 1:
+            x_batches: List[np.ndarray] = [_solve_batch(x0_batches[0], batch_args[0])]
+        else:
+            pool_executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            with pool_executor(max_workers=len(batches)) as executor:
+                x_batches = list(executor.map(_solve_batch, x0_batches, batch_args))
+
+        x_out: np.ndarray = np.empty_like(x0)
+        for pos, x in zip(batches, x_batches):
+            x_out[pos] = x.reshape(len(pos), *x0.shape[1:])
+
+        rec_pos, strm_pos = self._row_positions(df_measured.index, records)
+        df_res: pd.DataFrame = pd.DataFrame(x_out[rec_pos, strm_pos], index=df_measured.index,
+                                            columns=df_measured.columns)
         return df_res
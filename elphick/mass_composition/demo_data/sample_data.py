@@ -120,9 +120,17 @@ def size_distribution() -> pd.DataFrame:
     return df_psd
 
 
-def iron_ore_sample_data() -> pd.DataFrame:
+def iron_ore_sample_data(usecols: Optional[List[str]] = None) -> pd.DataFrame:
+    """Iron ore drill-hole assay sample data
+
+    Args:
+        usecols: Optional list of columns to read, which must include 'index'.  If None all columns are read.
+
+    Returns:
+        pd.DataFrame
+    """
     d: Path = Path(__file__).parent
-    df_psd: pd.DataFrame = pd.read_csv(d / 'iron_ore_sample_data_A072391.csv', index_col=0)
+    df_psd: pd.DataFrame = pd.read_csv(d / 'iron_ore_sample_data_A072391.csv', index_col='index', usecols=usecols)
     return df_psd
 
 
@@ -1,17 +1,17 @@
 import logging
 import webbrowser
-from copy import deepcopy
+from copy import copy
+from functools import reduce
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
-import matplotlib
 import networkx as nx
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import xarray as xr
 from matplotlib import pyplot as plt
 from matplotlib.colors import ListedColormap, LinearSegmentedColormap
-import matplotlib.cm as cm
 import seaborn as sns
 
 from plotly.subplots import make_subplots
@@ -21,13 +21,18 @@ from elphick.mass_composition.layout import digraph_linear_layout
 from elphick.mass_composition.mc_node import MCNode, NodeType
 from elphick.mass_composition.plot import parallel_plot, comparison_plot
 from elphick.mass_composition.utils.geometry import midpoint
-from elphick.mass_composition.utils.pd_utils import column_prefix_counts, column_prefixes
+from elphick.mass_composition.utils.pd_utils import column_prefixes
 
 
 class MCNetwork(nx.DiGraph):
     def __init__(self, **attr):
         super().__init__(**attr)
         self._logger: logging.Logger = logging.getLogger(__class__.__name__)
+        self._edge_by_name: Dict[str, MassComposition] = {}
+        self._agg_cache: Dict[str, Tuple[xr.Dataset, object, pd.DataFrame]] = {}
+        self._layout_cache: Dict[str, Tuple[Tuple, Dict]] = {}
+        self._fmt_map: Optional[Tuple[object, Dict[str, str]]] = None
+        self._title_cache: Optional[Tuple[Tuple, List, Tuple[bool, bool, Dict]]] = None
 
     @classmethod
     def from_streams(cls, streams: List[MassComposition], name: Optional[str] = 'Flowsheet') -> 'MCNetwork':
@@ -66,6 +71,7 @@ class MCNetwork(nx.DiGraph):
         # update the temporary nodes on the mc object property to match the renumbered integers
         for node1, node2, data in graph.edges(data=True):
             data['mc'].nodes = [node1, node2]
+        graph._index_edges()
 
         return graph
 
@@ -94,37 +100,45 @@ class MCNetwork(nx.DiGraph):
                 df.reset_index(mc_name_col, inplace=True)
             if mc_name_col not in df.columns:
                 raise KeyError(f'{mc_name_col} is not in the columns or indexes.')
-            names = df[mc_name_col].unique()
-            for obj_name in names:
-                res.append(MassComposition(
-                    data=df.query(f'{mc_name_col} == @obj_name')[[col for col in df.columns if col != mc_name_col]],
-                    name=obj_name))
+            # a single partitioning pass, in order of first appearance, rather than a query per object
+            other_cols: List[str] = [col for col in df.columns if col != mc_name_col]
+            for obj_name, df_obj in df.groupby(mc_name_col, sort=False):
+                res.append(MassComposition(data=df_obj[other_cols], name=obj_name))
             if index_names:  # reinstate the index on the original dataframe
                 df.reset_index(inplace=True)
                 df.set_index(index_names, inplace=True)
         else:
             # wide case - find prefixes where there are at least 3 columns
-            prefix_counts = column_prefix_counts(df.columns)
             prefix_cols = column_prefixes(df.columns)
-            for prefix, n in prefix_counts.items():
-                if n >= 3:
+            for prefix, cols in prefix_cols.items():
+                if len(cols) >= 3:
                     logger.info(f"Creating object for {prefix}")
-                    cols = prefix_cols[prefix]
+                    # the prefix columns are already in the order of the dataframe columns
                     res.append(MassComposition(
-                        data=df[[col for col in df.columns if col in cols]].rename(
-                            columns={col: col.replace(f'{prefix}_', '') for col in df.columns}),
+                        data=df[cols].rename(columns={col: col.replace(f'{prefix}_', '') for col in cols}),
                         name=prefix))
 
         return cls().from_streams(streams=res, name=name)
 
     @property
     def balanced(self) -> bool:
-        bal_vals: List = [self.nodes[n]['mc'].balanced for n in self.nodes]
-        bal_vals = [bv for bv in bal_vals if bv is not None]
-        return all(bal_vals)
+        # a generator, so evaluation stops at the first unbalanced node
+        return all(bv is None or bv for bv in (mc.balanced for _, mc in self.nodes(data='mc')))
+
+    @property
+    def is_edge_status_ok(self) -> bool:
+        """True if the status of every edge object is ok - stops at the first failing edge"""
+        return all(mc.status.ok for _, _, mc in self.edges(data='mc'))
 
     @property
     def edge_status(self) -> Tuple:
+        """The edge status with the failing components of any failing edges
+
+        Use is_edge_status_ok when only the boolean status is required.
+
+        Returns:
+            Tuple of the boolean status and a dict of failing components keyed by edge name
+        """
         d_edge_status_ok: Dict = {}
         d_failing_edges: Dict = {}
         for u, v, data in self.edges(data=True):
@@ -143,16 +157,56 @@ class MCNetwork(nx.DiGraph):
 
         """
 
-        res: Optional[MassComposition] = None
-        for u, v, a in self.edges(data=True):
-            if a['mc'].name == name:
-                res = a['mc']
+        res: Optional[MassComposition] = self._edge_by_name.get(name)
+        if (res is None or res.name != name or not self.has_edge(*res.nodes)
+                or self.edges[tuple(res.nodes)]['mc'] is not res):
+            # the network (or an object name) has changed since the edges were indexed
+            self._index_edges()
+            res = self._edge_by_name.get(name)
 
         if not res:
             raise ValueError(f"The specified name: {name} is not found on the network.")
 
         return res
 
+    def _index_edges(self):
+        """Index the MC objects on the edges by name, for constant time lookup"""
+        self._edge_by_name = {a['mc'].name: a['mc'] for u, v, a in self.edges(data=True)}
+
+    def _edge_soa(self) -> Dict[str, np.ndarray]:
+        """The per-edge fields used by the plot methods, as arrays in edge order
+
+        A structure of arrays (source, target, name and status_ok), built afresh on each call so that the status
+        reflects any update_data on the edge objects.
+
+        Returns:
+            Dict of arrays keyed by field
+        """
+        edges: List[Tuple] = list(self.edges(data='mc'))
+        soa: Dict[str, np.ndarray] = {'source': np.array([u for u, _, _ in edges]),
+                                      'target': np.array([v for _, v, _ in edges]),
+                                      'name': np.array([mc.name for _, _, mc in edges], dtype=object),
+                                      'status_ok': np.array([bool(mc.status.ok) for _, _, mc in edges], dtype=bool)}
+        return soa
+
+    def _edge_aggregate(self, mc: MassComposition) -> pd.DataFrame:
+        """The aggregate of an edge object, cached until the object data is set or updated
+
+        Both set_data and update_data (which writes the values in place) replace the object status, so the status
+        identity is part of the cache key along with the data object.
+
+        Args:
+            mc: The MassComposition object on the edge
+
+        Returns:
+            The aggregate DataFrame
+        """
+        cached: Optional[Tuple[xr.Dataset, object, pd.DataFrame]] = self._agg_cache.get(mc.name)
+        if cached is None or cached[0] is not mc._data or cached[1] is not mc.status:
+            cached = (mc._data, mc.status, mc.aggregate())
+            self._agg_cache[mc.name] = cached
+        return cached[2]
+
     def get_edge_names(self) -> List[str]:
         """Get the names of the MC objects on the edges
 
@@ -172,8 +226,7 @@ class MCNetwork(nx.DiGraph):
             List of MassComposition objects
         """
 
-        degrees = [d for n, d in self.degree()]
-        res: List[MassComposition] = [d['mc'] for u, v, d in self.edges(data=True) if degrees[u] == 1]
+        res: List[MassComposition] = [d['mc'] for u, v, d in self.edges(data=True) if self.in_degree(u) == 0]
         return res
 
     def get_output_edges(self) -> List[MassComposition]:
@@ -183,8 +236,7 @@ class MCNetwork(nx.DiGraph):
             List of MassComposition objects
         """
 
-        degrees = [d for n, d in self.degree()]
-        res: List[MassComposition] = [d['mc'] for u, v, d in self.edges(data=True) if degrees[v] == 1]
+        res: List[MassComposition] = [d['mc'] for u, v, d in self.edges(data=True) if self.out_degree(v) == 0]
         return res
 
     def get_column_formats(self, columns: List[str], strip_percent: bool = False) -> Dict[str, str]:
@@ -197,17 +249,23 @@ class MCNetwork(nx.DiGraph):
         Returns:
 
         """
-        variables = self.get_input_edges()[0].variables
-        d_format: Dict = {}
-        for col in columns:
-            for v in variables.vars.variables:
-                if col in [v.column_name, v.name]:
-                    d_format[col] = v.format
-                    if strip_percent:
-                        d_format[col] = d_format[col].strip('%')
-
+        fmt_map: Dict[str, str] = self._get_format_map()
+        d_format: Dict = {col: (fmt_map[col].strip('%') if strip_percent else fmt_map[col])
+                          for col in columns if col in fmt_map}
         return d_format
 
+    def _get_format_map(self) -> Dict[str, str]:
+        """The format strings keyed by both column name and variable name, cached per variables object
+
+        Returns:
+            Dict of format strings
+        """
+        variables = self.get_input_edges()[0].variables
+        if self._fmt_map is None or self._fmt_map[0] is not variables:
+            self._fmt_map = (variables, {name: v.format for v in variables.vars.variables
+                                         for name in [v.column_name, v.name]})
+        return self._fmt_map[1]
+
     def report(self, apply_formats: bool = False) -> pd.DataFrame:
         """Summary Report
 
@@ -216,14 +274,17 @@ class MCNetwork(nx.DiGraph):
 
         """
         chunks: List[pd.DataFrame] = []
+        names: List[str] = []
         for n, nbrs in self.adj.items():
             for nbr, eattr in nbrs.items():
-                chunks.append(eattr['mc'].aggregate().assign(name=eattr['mc'].name))
-        rpt: pd.DataFrame = pd.concat(chunks, axis='index').set_index('name')
+                chunks.append(self._edge_aggregate(eattr['mc']))
+                names.append(eattr['mc'].name)
+        rpt: pd.DataFrame = pd.concat(chunks, axis='index', ignore_index=True)
+        rpt.index = pd.Index(names, name='name')
         if apply_formats:
-            fmts: Dict = self.get_column_formats(rpt.columns)
-            for k, v in fmts.items():
-                rpt[k] = rpt[k].apply((v.replace('%', '{:,') + '}').format)
+            formatters: Dict = {k: (v.replace('%', '{:,') + '}').format
+                                for k, v in self.get_column_formats(rpt.columns).items()}
+            rpt = rpt.apply(lambda col: col.map(formatters[col.name]) if col.name in formatters else col)
         return rpt
 
     def imbalance_report(self, node: int):
@@ -256,7 +317,8 @@ class MCNetwork(nx.DiGraph):
             if a['mc'].name == mc_name:
                 mc_objects.append(mc_obj_ref)
             else:
-                mc_obj: MassComposition = deepcopy(self.get_edge_by_name(a['mc'].name))
+                # a shallow copy suffices since the data is replaced by the (new) selection
+                mc_obj: MassComposition = copy(a['mc'])
                 mc_obj._data = mc_obj._data.sel({coord: index.values})
                 mc_objects.append(mc_obj)
 
@@ -283,27 +345,17 @@ class MCNetwork(nx.DiGraph):
 
         hf, ax = plt.subplots()
         # pos = nx.spring_layout(self, seed=1234)
-        pos = digraph_linear_layout(self, orientation=orientation)
+        pos = self._get_layout(orientation=orientation)
 
         edge_labels: Dict = {}
         edge_colors: List = []
-        node_colors: List = []
 
-        for node1, node2, data in self.edges(data=True):
-            edge_labels[(node1, node2)] = data['mc'].name
-            if data['mc'].status.ok:
-                edge_colors.append('gray')
-            else:
-                edge_colors.append('red')
-
-        for n in self.nodes:
-            if self.nodes[n]['mc'].node_type == NodeType.BALANCE:
-                if self.nodes[n]['mc'].balanced:
-                    node_colors.append('green')
-                else:
-                    node_colors.append('red')
-            else:
-                node_colors.append('gray')
+        soa: Dict[str, np.ndarray] = self._edge_soa()
+        edge_labels = dict(zip(zip(soa['source'].tolist(), soa['target'].tolist()), soa['name'].tolist()))
+        edge_colors = np.where(soa['status_ok'], 'gray', 'red').tolist()
+
+        node_colors: List = [('green' if mc.balanced else 'red') if mc.node_type == NodeType.BALANCE else 'gray'
+                             for _, mc in self.nodes(data='mc')]
 
         nx.draw(self, pos=pos, ax=ax, with_labels=True, font_weight='bold',
                 node_color=node_colors, edge_color=edge_colors)
@@ -325,20 +377,24 @@ class MCNetwork(nx.DiGraph):
 
         """
         # prepare the data
-        chunks_in: List = []
-        chunks_out: List = []
-        for n in self.nodes:
-            if self.nodes[n]['mc'].node_type == NodeType.BALANCE:
-                chunks_in.append(self.nodes[n]['mc'].add('in').assign(**{'direction': 'in', 'node': n}))
-                chunks_out.append(self.nodes[n]['mc'].add('out').assign(**{'direction': 'out', 'node': n}))
-        df_in: pd.DataFrame = pd.concat(chunks_in)
-        index_names = ['direction', 'node'] + df_in.index.names
-        df_in = df_in.reset_index().melt(id_vars=index_names)
-        df_out: pd.DataFrame = pd.concat(chunks_out).reset_index().melt(id_vars=index_names)
-        df_plot: pd.DataFrame = pd.concat([df_in, df_out])
-        df_plot = df_plot.set_index(index_names + ['variable'], append=True).unstack(['direction'])
-        df_plot.columns = df_plot.columns.droplevel(0)
-        df_plot.reset_index(level=list(np.arange(-1, -len(index_names) - 1, -1)), inplace=True)
+        chunks: List = []
+        for n, mc in self.nodes(data='mc'):
+            if mc.node_type is not NodeType.BALANCE:
+                continue
+            for direction in ['in', 'out']:
+                # the added frames are new objects, so tag them in place rather than copying with assign
+                df_node: pd.DataFrame = mc.add(direction)
+                df_node['direction'], df_node['node'] = direction, n
+                chunks.append(df_node)
+        df_long: pd.DataFrame = pd.concat(chunks)
+        index_names: List[str] = ['node'] + list(df_long.index.names) + ['variable']
+        df_long = df_long.reset_index().melt(id_vars=index_names[:-1] + ['direction'])
+        # a single reshape to in and out columns - unstack, unlike pivot_table, raises on duplicate entries
+        # rather than averaging them, and keeps all-nan columns.  Rows (and so facets) keep their order of appearance.
+        values: pd.Series = df_long.set_index(index_names + ['direction'])['value']
+        df_plot: pd.DataFrame = values.unstack('direction').reindex(values.index.droplevel('direction').unique())
+        df_plot = df_plot.reset_index()
+        df_plot.columns.name = None
         df_plot['node'] = pd.Categorical(df_plot['node'])
 
         # plot
@@ -358,7 +414,7 @@ class MCNetwork(nx.DiGraph):
 
         """
         # pos = nx.spring_layout(self, seed=1234)
-        pos = digraph_linear_layout(self, orientation=orientation)
+        pos = self._get_layout(orientation=orientation)
 
         edge_traces, node_trace, edge_annotation_trace = self._get_scatter_node_edges(pos)
         title = self._plot_title()
@@ -469,9 +525,9 @@ class MCNetwork(nx.DiGraph):
             columnwidth=column_widths,
             cells=dict(values=df.transpose().values.tolist(),
                        align='left', format=fmt,
+                       # a single column of row colors, which plotly applies to all columns
                        fill_color=[
-                           [table_odd_color if i % 2 == 0 else table_even_color for i in range(len(df))] * len(
-                               df.columns)]),
+                           np.where(np.arange(len(df)) % 2 == 0, table_odd_color, table_even_color).tolist()]),
             **d_table)
 
         if plot_type == 'sankey':
@@ -485,7 +541,7 @@ class MCNetwork(nx.DiGraph):
 
         elif plot_type == 'network':
             # pos = nx.spring_layout(self, seed=1234)
-            pos = digraph_linear_layout(self, orientation=network_orientation)
+            pos = self._get_layout(orientation=network_orientation)
 
             edge_traces, node_trace, edge_annotation_trace = self._get_scatter_node_edges(pos)
             fig.add_traces(data=[*edge_traces, node_trace, edge_annotation_trace], **d_plot)
@@ -515,10 +571,14 @@ class MCNetwork(nx.DiGraph):
 
         """
         chunks: List[pd.DataFrame] = []
+        mc_names: List[str] = []
         for u, v, data in self.edges(data=True):
             if (names is None) or ((names is not None) and (data['mc'].name in names)):
-                chunks.append(data['mc'].data.mc.to_dataframe().assign(name=data['mc'].name))
-        return pd.concat(chunks, axis='index').set_index('name', append=True)
+                chunks.append(data['mc'].data.mc.to_dataframe())
+                mc_names.append(data['mc'].name)
+        # the names are added as an outer index level by concat, then moved to be the last level
+        df: pd.DataFrame = pd.concat(chunks, axis='index', keys=mc_names, names=['name'])
+        return df.reorder_levels(list(range(1, df.index.nlevels)) + [0])
 
     def plot_parallel(self,
                       names: Optional[str] = None,
@@ -553,6 +613,22 @@ class MCNetwork(nx.DiGraph):
                             include_dims=include_dims, plot_interval_edges=plot_interval_edges)
         return fig
 
+    def _get_layout(self, orientation: str = 'horizontal') -> Dict:
+        """The network layout, cached until the network edges change
+
+        Args:
+            orientation: 'horizontal'|'vertical' network layout
+
+        Returns:
+            Dict of node positions
+        """
+        edges: Tuple = tuple(self.edges)
+        cached: Optional[Tuple[Tuple, Dict]] = self._layout_cache.get(orientation)
+        if cached is None or cached[0] != edges:
+            cached = (edges, digraph_linear_layout(self, orientation=orientation))
+            self._layout_cache[orientation] = cached
+        return cached[1]
+
     @staticmethod
     def _get_position_kwargs(table_pos, table_area, plot_type):
         """Helper to manage location dependencies
@@ -604,47 +680,30 @@ class MCNetwork(nx.DiGraph):
         rpt: pd.DataFrame = self.report()
         if color_var is not None:
             cmap = sns.color_palette(edge_colormap, as_cmap=True)
-            rpt: pd.DataFrame = self.report()
             if not v_min:
                 v_min = np.floor(rpt[color_var].min())
             if not v_max:
                 v_max = np.ceil(rpt[color_var].max())
-        if isinstance(list(self.nodes)[0], int):
-            labels = [str(n) for n in list(self.nodes)]
-        else:
-            labels = list(self.nodes)
+        labels: List = [str(n) for n in self.nodes] if isinstance(next(iter(self.nodes)), int) else list(self.nodes)
         # run the report for the hover data
         d_custom_data: Dict = self._rpt_to_html(df=rpt)
-        source: List = []
-        target: List = []
-        value: List = []
-        edge_custom_data = []
-        edge_color: List = []
-        edge_labels: List = []
-        node_colors: List = []
-
-        for n in self.nodes:
-            if self.nodes[n]['mc'].node_type == NodeType.BALANCE:
-                if self.nodes[n]['mc'].balanced:
-                    node_colors.append('green')
-                else:
-                    node_colors.append('red')
-            else:
-                node_colors.append('blue')
+        node_colors: List = [('green' if mc.balanced else 'red') if mc.node_type == NodeType.BALANCE else 'blue'
+                             for _, mc in self.nodes(data='mc')]
 
-        for u, v, data in self.edges(data=True):
-            edge_labels.append(data['mc'].name)
-            source.append(u)
-            target.append(v)
-            value.append(float(data['mc'].aggregate()[width_var].iloc[0]))
-            edge_custom_data.append(d_custom_data[data['mc'].name])
-
-            if color_var is not None:
-                val: float = float(data['mc'].aggregate()[color_var].iloc[0])
-                str_color: str = f'rgba{self._color_from_float(v_min, v_max, val, cmap)}'
-                edge_color.append(str_color)
-            else:
-                edge_color: Optional[str] = None
+        soa: Dict[str, np.ndarray] = self._edge_soa()
+        source: List = soa['source'].tolist()
+        target: List = soa['target'].tolist()
+        edge_labels: List = soa['name'].tolist()
+        edge_custom_data: List = [d_custom_data[name] for name in edge_labels]
+
+        # the report rows are the edge aggregates, in edge order, so extract the columns in one pass
+        value: List = rpt[width_var].to_numpy(dtype=np.float64).tolist()
+        if color_var is not None:
+            # map all edge values through the colormap at once
+            color_vals: np.ndarray = rpt[color_var].to_numpy(dtype=np.float64)
+            edge_color: List = [f'rgba{c}' for c in self._colors_from_floats(v_min, v_max, color_vals, cmap)]
+        else:
+            edge_color: Optional[str] = None
 
         d_sankey: Dict = {'node_color': node_colors,
                           'edge_color': edge_color,
@@ -681,19 +740,28 @@ class MCNetwork(nx.DiGraph):
 
     def _get_scatter_node_edges(self, pos):
         # edges
-        edge_color_map: Dict = {True: 'grey', False: 'red'}
-        edge_annotations: Dict = {}
+        soa: Dict[str, np.ndarray] = self._edge_soa()
+        pos_source: np.ndarray = np.array([pos[u] for u in soa['source'].tolist()]).reshape(-1, 2)
+        pos_target: np.ndarray = np.array([pos[v] for v in soa['target'].tolist()]).reshape(-1, 2)
+        edge_labels: List[str] = soa['name'].tolist()
+        edge_label_x, edge_label_y = midpoint(pos_source, pos_target).T.tolist()
+        edge_line_colors: List[str] = np.where(soa['status_ok'], 'grey', 'red').tolist()
+
+        # one trace per line color rather than per edge - the edge segments are packed into a single
+        # buffer of (source, target, gap) rows, with the nan gap breaking the line between edges
+        segments: np.ndarray = np.full((len(edge_labels), 3, 2), np.nan)
+        segments[:, 0, :], segments[:, 1, :] = pos_source, pos_target
+        segment_text: np.ndarray = np.repeat(np.array(edge_labels, dtype=object), 3).reshape(-1, 3)
+        segment_text[:, 2] = None
 
         edge_traces = []
-        for u, v, data in self.edges(data=True):
-            x0, y0 = pos[u]
-            x1, y1 = pos[v]
-            edge_annotations[data['mc'].name] = {'pos': midpoint(pos[u], pos[v])}
-            edge_traces.append(go.Scatter(x=[x0, x1], y=[y0, y1],
-                                          line=dict(width=2, color=edge_color_map[data['mc'].status.ok]),
+        for color in dict.fromkeys(edge_line_colors):
+            mask: np.ndarray = np.array(edge_line_colors) == color
+            edge_traces.append(go.Scatter(x=segments[mask, :, 0].ravel(), y=segments[mask, :, 1].ravel(),
+                                          line=dict(width=2, color=color),
                                           hoverinfo='text',
                                           mode='lines',
-                                          text=data['mc'].name))
+                                          text=segment_text[mask].ravel().tolist()))
 
         # nodes
         node_color_map: Dict = {None: 'grey', True: 'green', False: 'red'}
@@ -701,11 +769,11 @@ class MCNetwork(nx.DiGraph):
         node_y = []
         node_color = []
         node_text = []
-        for node in self.nodes():
+        for node, mc in self.nodes(data='mc'):
             x, y = pos[node]
             node_x.append(x)
             node_y.append(y)
-            node_color.append(node_color_map[self.nodes[node]['mc'].balanced])
+            node_color.append(node_color_map[mc.balanced])
             node_text.append(node)
         node_trace = go.Scatter(
             x=node_x, y=node_y,
@@ -718,10 +786,6 @@ class MCNetwork(nx.DiGraph):
             text=node_text)
 
         # edge annotations
-        edge_labels = list(edge_annotations.keys())
-        edge_label_x = [edge_annotations[k]['pos'][0] for k, v in edge_annotations.items()]
-        edge_label_y = [edge_annotations[k]['pos'][1] for k, v in edge_annotations.items()]
-
         edge_annotation_trace = go.Scatter(
             x=edge_label_x, y=edge_label_y,
             mode='markers',
@@ -735,79 +799,122 @@ class MCNetwork(nx.DiGraph):
         return edge_traces, node_trace, edge_annotation_trace
 
     def _rpt_to_html(self, df: pd.DataFrame) -> Dict:
-        custom_data: Dict = {}
         fmts: Dict = self.get_column_formats(df.columns)
-        for i, row in df.iterrows():
-            str_data: str = '<br />'
-            for k, v in dict(row).items():
-                str_data += f"{k}: {v:{fmts[k][1:]}}<br />"
-            custom_data[i] = str_data
+        # format whole columns at once, then concatenate the columns element-wise in a single pass
+        parts: List[pd.Series] = [df[k].map(f"<br />{k}: {{:{fmts[k][1:]}}}".format) for k in df.columns]
+        str_data: pd.Series = parts[0].str.cat(parts[1:]) + '<br />'
+        custom_data: Dict = str_data.to_dict()
         return custom_data
 
     @staticmethod
     def _color_from_float(vmin: float, vmax: float, val: float,
                           cmap: Union[ListedColormap, LinearSegmentedColormap]) -> Tuple[float, float, float]:
+        # a single value is a batch of one - avoids building a ScalarMappable per call
+        return MCNetwork._colors_from_floats(vmin, vmax, np.array([val], dtype=np.float64), cmap)[0]
+
+    @staticmethod
+    def _colors_from_floats(vmin: float, vmax: float, vals: np.ndarray,
+                            cmap: Union[ListedColormap, LinearSegmentedColormap]) -> List[Tuple]:
+        """The vectorised equivalent of _color_from_float
+
+        Args:
+            vmin: The value that maps to the minimum color
+            vmax: The value that maps to the maximum color
+            vals: The values to map to colors
+            cmap: The colormap
+
+        Returns:
+            List of color tuples, one per value
+        """
         if isinstance(cmap, ListedColormap):
-            color_index: int = int((val - vmin) / ((vmax - vmin) / 256.0))
-            color_index = min(max(0, color_index), 255)
-            color_rgba = tuple(cmap.colors[color_index])
+            # gather from the color table in one pass, converting to tuples only at the plotly boundary
+            # non-finite values take the colormap bad color, and a zero range maps to the first color
+            colors_arr: np.ndarray = np.asarray(cmap.colors)
+            finite: np.ndarray = np.isfinite(vals)
+            scaled: np.ndarray = np.zeros_like(vals, dtype=np.float64)
+            if vmax != vmin:
+                np.multiply(vals - vmin, 256.0 / (vmax - vmin), out=scaled, where=finite)
+            color_index: np.ndarray = np.clip(scaled, 0, 255).astype(np.int64)
+            colors_out: np.ndarray = colors_arr[color_index]
+            colors_out[~finite] = np.asarray(cmap(np.nan))[:colors_arr.shape[1]]
+            colors_rgba: List[Tuple] = list(map(tuple, colors_out.tolist()))
         elif isinstance(cmap, LinearSegmentedColormap):
-            norm = matplotlib.colors.Normalize(vmin=vmin, vmax=vmax)
-            m = cm.ScalarMappable(norm=norm, cmap=cmap)
-            r, g, b, a = m.to_rgba(val, bytes=True)
-            color_rgba = int(r), int(g), int(b), int(a)
+            # normalise inline - values outside [0, 1] take the colormap under/over colors, as with Normalize
+            norm_vals: np.ndarray = (vals - vmin) / (vmax - vmin) if vmax != vmin else np.zeros_like(vals)
+            colors_rgba = [tuple(rgba) for rgba in cmap(norm_vals, bytes=True).tolist()]
         else:
-            NotImplementedError("Unrecognised colormap type")
+            raise NotImplementedError("Unrecognised colormap type")
+
+        return colors_rgba
+
+    def _title_status(self) -> Tuple[bool, bool, Dict]:
+        """The balanced and edge status reported in plot titles
 
-        return color_rgba
+        The status is cached until the network edges change, or the data of the edge objects is set or updated
+        (both of which replace the object status).
+
+        Returns:
+            Tuple of balanced, edge status ok and the dict of failing edges
+        """
+        edges: Tuple = tuple(self.edges)
+        edge_data: List = [(mc._data, mc.status) for _, _, mc in self.edges(data='mc')]
+        if (self._title_cache is None or self._title_cache[0] != edges
+                or any(a[0] is not b[0] or a[1] is not b[1] for a, b in zip(self._title_cache[1], edge_data))):
+            edge_status_ok: bool = self.is_edge_status_ok
+            failing_edges: Dict = {} if edge_status_ok else self.edge_status[1]
+            self._title_cache = (edges, edge_data, (self.balanced, edge_status_ok, failing_edges))
+        return self._title_cache[2]
 
     def _plot_title(self, html: bool = True, compact: bool = False):
-        title = f"{self.name}<br><br><sup>Balanced: {self.balanced}<br>Edge Status OK: {self.edge_status[0]}</sup>"
-        if compact:
-            title = title.replace("<br><br>", "<br>").replace("<br>Edge", ", Edge")
-        if not self.edge_status[0]:
-            title = title.replace("</sup>", "") + f", {self.edge_status[1]}</sup>"
-        if not html:
-            title = title.replace('<br><br>', '\n').replace('<br>', '\n').replace('<sup>', '').replace('</sup>', '')
+        balanced, edge_status_ok, failing_edges = self._title_status()
+        # choose the delimiters up front and build the title in one pass
+        name_sep: str = ('<br>' if compact else '<br><br>') if html else '\n'
+        status_sep: str = ', ' if compact else ('<br>' if html else '\n')
+        sup_open, sup_close = ('<sup>', '</sup>') if html else ('', '')
+        failing: str = '' if edge_status_ok else f", {failing_edges}"
+        title = (f"{self.name}{name_sep}{sup_open}Balanced: {balanced}{status_sep}"
+                 f"Edge Status OK: {edge_status_ok}{failing}{sup_close}")
         return title
 
     @classmethod
     def _check_indexes(cls, streams):
         logger: logging.Logger = logging.getLogger(__class__.__name__)
 
-        list_of_indexes = [s.data.to_dataframe().index for s in streams]
-        types_of_indexes = [type(i) for i in list_of_indexes]
-        # check the index types are consistent
-        if len(set(types_of_indexes)) != 1:
-            raise KeyError("stream index types are not consistent")
+        # materialise each stream once, for reuse by the checks and the alignment below
+        dfs: Dict[str, pd.DataFrame] = {s.name: s.data.to_dataframe() for s in streams}
+        list_of_indexes = [dfs[s.name].index for s in streams]
+        first_index: pd.Index = list_of_indexes[0]
+        shapes_consistent: bool = True
+        # check the index types are consistent, stopping at the first mismatch
+        for stream, index in zip(streams[1:], list_of_indexes[1:]):
+            if type(index) is not type(first_index):
+                raise KeyError(f"stream index types are not consistent - {stream.name} has {type(index).__name__}, "
+                               f"expected {type(first_index).__name__}")
+            shapes_consistent = shapes_consistent and index.shape == first_index.shape
 
         # check the shapes are consistent
-        if len(np.unique([i.shape for i in list_of_indexes])) != 1:
+        if not shapes_consistent:
             if list_of_indexes[0].names == ['size']:
                 logger.debug(f"size index detected - attempting index alignment")
                 # two failure modes can be managed:
                 # 1) missing coarse size fractions - can be added with zeros
                 # 2) missing intermediate fractions - require interpolation to preserve mass
-                df_streams: pd.DataFrame = pd.concat([s.data.to_dataframe().assign(stream=s.name) for s in streams])
-                df_streams_full = df_streams.pivot(columns=['stream'])
-                df_streams_full.columns.names = ['component', 'stream']
-                df_streams_full.sort_index(ascending=False, inplace=True)
-                stream_nans: pd.DataFrame = df_streams_full.isna().stack(level=-1)
+                # the union of the stream indexes, coarsest first
+                full_index: pd.Index = reduce(lambda a, b: a.union(b), list_of_indexes).sort_values(ascending=False)
 
                 for stream in streams:
                     s: str = stream.name
-                    tmp_nans: pd.Series = stream_nans.query('stream==@s').sum(axis=1)
-                    if tmp_nans.iloc[0] > 0:
+                    is_missing: np.ndarray = ~full_index.isin(dfs[s].index)
+                    if is_missing[0]:
                         logging.debug(f'The {s} stream has missing coarse sizes')
-                        first_zero_index = tmp_nans.loc[tmp_nans == 0].index[0]
-                        if tmp_nans[tmp_nans.index <= first_zero_index].sum() > 0:
+                        first_present: int = int(np.argmin(is_missing))
+                        if is_missing[first_present:].any():
                             logging.debug(f'The {s} stream has missing sizes requiring interpolation')
                             raise NotImplementedError('Coming soon - we need interpolation!')
                         else:
                             logging.debug(f'The {s} stream has missing coarse sizes only')
-                            stream_df = df_streams_full.loc[:, (slice(None), s)].droplevel(-1, axis=1).fillna(0)
-                            # recreate the stream from the dataframe
-                            stream.set_data(stream_df)
+                            # recreate the stream from the dataframe, with the missing sizes as zeros
+                            stream.set_data(dfs[s].reindex(full_index, fill_value=0))
             else:
                 raise KeyError("stream index shapes are not consistent")
         return streams
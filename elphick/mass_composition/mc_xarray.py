@@ -504,9 +504,36 @@ def mc_aggregate(xr_ds: xr.Dataset) -> xr.Dataset:
     Returns:
 
     """
-    chem: xr.Dataset = xr_ds.mc._chem.weighted(weights=xr_ds.mc._mass['mass_dry'].fillna(0)).mean(keep_attrs=True)
+    chem: xr.Dataset = _weighted_mean(xr_ds.mc._chem, weights=xr_ds.mc._mass['mass_dry'].fillna(0))
     mass: xr.Dataset = xr_ds.mc._mass.sum(keep_attrs=True)
     res: xr.Dataset = xr.merge([mass, chem])
     res.attrs['mc_vars_attrs'] = []
     res.mc.rename(f'Aggregate of {xr_ds.mc.name}')
     return res
+
+
+def _weighted_mean(ds: xr.Dataset, weights: xr.DataArray) -> xr.Dataset:
+    """The weighted mean of all variables in a dataset across all dims
+
+    Equivalent to ds.weighted(weights).mean(keep_attrs=True) (nan values are skipped), but the variables are
+    stacked and reduced with a single matrix-vector product rather than a reduction per variable.
+
+    Args:
+        ds: The dataset of variables to average
+        weights: The weights, with the same dims as the variables
+
+    Returns:
+        The dataset of 0D weighted means
+    """
+
+    if any(da.dims != weights.dims for da in ds.data_vars.values()):
+        return ds.weighted(weights=weights).mean(keep_attrs=True)
+
+    values: np.ndarray = np.stack([da.values.ravel() for da in ds.data_vars.values()])
+    w: np.ndarray = weights.values.ravel()
+    valid: np.ndarray = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means: np.ndarray = (np.where(valid, values, 0.0) @ w) / (valid @ w)
+
+    return xr.Dataset({k: xr.DataArray(v, attrs=da.attrs) for (k, da), v in zip(ds.data_vars.items(), means)},
+                      attrs=ds.attrs)
@@ -1,5 +1,6 @@
 from typing import Optional, List, Union, Dict, Tuple
 
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
@@ -46,19 +47,23 @@ def parallel_plot(data: pd.DataFrame,
         for d in include_dims:
             df.reset_index(d, inplace=True)
 
-    interval_cols: Dict[str, int] = {col: i for i, col in enumerate(df.columns) if df[col].dtype == 'interval'}
-
-    for col, pos in interval_cols.items():
+    # collect the columns in order, replacing any interval columns, then build the frame once
+    plot_cols: Dict = {}
+    for col in df.columns:
+        if df[col].dtype != 'interval':
+            plot_cols[col] = df[col]
+            continue
+        arr: pd.arrays.IntervalArray = df[col].array
         if plot_interval_edges:
-            df.insert(loc=pos + 1, column=f'{col}_left', value=df[col].array.left)
-            df.insert(loc=pos + 2, column=f'{col}_right', value=df[col].array.right)
-            df.drop(columns=col, inplace=True)
+            plot_cols[f'{col}_left'] = arr.left
+            plot_cols[f'{col}_right'] = arr.right
         else:
             # workaround for https://github.com/Elphick/mass-composition/issues/1
             if col == 'size':
-                df[col] = mean_size(pd.arrays.IntervalArray(df[col]))
+                plot_cols[col] = mean_size(arr)
             else:
-                df[col] = df[col].array.mid
+                plot_cols[col] = arr.mid
+    df = pd.DataFrame(plot_cols, index=df.index)
 
     fig = plot_parallel(data=df, color=color, title=title)
     return fig
@@ -81,17 +86,19 @@ def comparison_plot(data: pd.DataFrame,
         plotly Figure
     """
 
-    data['residual'] = data[x] - data[y]
+    # the residual is passed as hover data, rather than added to the caller's frame
+    residual: np.ndarray = (data[x] - data[y]).to_numpy()
     fig = px.scatter(data, x=x, y=y, color=color,
                      facet_col='variable', facet_col_wrap=facet_col_wrap,
-                     hover_data=['residual'])
+                     hover_data={'residual': residual})
 
-    # add y=x based on data per subplot
+    # add y=x based on data per subplot, with the limits of all subplots from a single groupby
+    stats: pd.DataFrame = data.groupby('variable').agg({x: ['min', 'max'], y: ['min', 'max']})
     d_subplots = subplot_index_by_title(fig)
     for k, v in d_subplots.items():
-        tmp_df = data.query('variable==@k')
-        limits = [min([tmp_df[x].min(), tmp_df[y].min()]),
-                  max([tmp_df[x].max(), tmp_df[y].max()])]
+        row: pd.Series = stats.loc[k]
+        limits = [min([row[(x, 'min')], row[(y, 'min')]]),
+                  max([row[(x, 'max')], row[(y, 'max')]])]
 
         equal_trace = go.Scatter(x=limits, y=limits,
                                  line_color="gray", name="y=x", mode='lines', showlegend=False)
@@ -118,8 +125,6 @@ def subplot_index_by_title(fig) -> Dict['str', Tuple[int, int]]:
         Dict keyed by title with tuple of subplot positions
     """
     variable_order = [a.text.split("=")[-1] for a in fig.layout.annotations]
-    d_subplots = {}
-    for ri, r in enumerate(fig._grid_ref):
-        for ci, c in enumerate(r):
-            d_subplots[variable_order.pop(0)] = (ri + 1, ci + 1)
+    positions = [(ri + 1, ci + 1) for ri, r in enumerate(fig._grid_ref) for ci, _ in enumerate(r)]
+    d_subplots = dict(zip(variable_order, positions))
     return d_subplots
@@ -24,9 +24,10 @@ import xarray as xr
 #
 # We get some demo data in the form of a pandas DataFrame
 
-df_data: pd.DataFrame = iron_ore_sample_data()
+# only the columns of interest are read
+df_data: pd.DataFrame = iron_ore_sample_data(usecols=['index', 'mass_dry', 'H2O', 'Al2O3', 'Fe', 'SiO2', 'DHID',
+                                                      'interval_from', 'interval_to'])
 name = 'A072391'
-df_data.drop(columns=['Na2O', 'CaO', 'MnO', 'TiO2', 'P', 'K2O', 'MgO'], inplace=True)
 
 print(df_data.shape)
 df_data.head()
@@ -1,8 +1,11 @@
+import numpy as np
 import pandas as pd
+import xarray as xr
 
 # noinspection PyUnresolvedReferences
 from test.fixtures import demo_data
 from elphick.mass_composition import MassComposition
+from elphick.mass_composition.mc_xarray import _weighted_mean
 
 
 def test_aggregation(demo_data):
@@ -16,3 +19,15 @@ def test_aggregation(demo_data):
                                               'Al2O3': [1.873077],
                                               'LOI': [4.0]}, index=pd.Index(['unnamed'], name='name'))
     pd.testing.assert_frame_equal(df_expected, df_agg)
+
+
+def test_weighted_mean(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data)
+    ds: xr.Dataset = obj_mc._data
+    ds['Fe'][0] = np.nan  # nan values are skipped
+    weights: xr.DataArray = ds.mc._mass['mass_dry']
+
+    ds_expected: xr.Dataset = ds.mc._chem.weighted(weights=weights).mean(keep_attrs=True)
+    ds_res: xr.Dataset = _weighted_mean(ds.mc._chem, weights=weights)
+    xr.testing.assert_allclose(ds_expected, ds_res)
+    assert all(ds_res[v].attrs == ds_expected[v].attrs for v in ds_expected.data_vars)
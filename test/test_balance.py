@@ -0,0 +1,120 @@
+from functools import partial
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import approx_fprime
+
+from elphick.mass_composition import MassComposition
+from elphick.mass_composition.balance import MCBalance, cost_fn, residual, residual_jac
+from elphick.mass_composition.mc_network import MCNetwork
+from elphick.mass_composition.utils.partition import napier_munn
+# noinspection PyUnresolvedReferences
+from test.fixtures import size_assay_data
+
+
+@pytest.fixture
+def size_networks(size_assay_data):
+    mc_size: MassComposition = MassComposition(size_assay_data, name='size sample')
+    partition = partial(napier_munn, d50=0.150, ep=0.1, dim='size')
+    mc_coarse, mc_fine = mc_size.partition(definition=partition, name_1='coarse', name_2='fine')
+    mcn: MCNetwork = MCNetwork().from_streams([mc_size, mc_coarse, mc_fine])
+
+    # corrupt the coarse stream so the network no longer balances
+    df_coarse: pd.DataFrame = mc_coarse.data.to_dataframe()
+    df_coarse[['mass_wet', 'mass_dry']] = df_coarse[['mass_wet', 'mass_dry']] * 1.1
+    mc_coarse_2: MassComposition = MassComposition(data=df_coarse, name='coarse').set_parent(mc_size)
+    mcn_ub: MCNetwork = MCNetwork().from_streams([mc_size, mc_coarse_2, mc_fine])
+    return mcn, mcn_ub
+
+
+def test_cost_balanced(size_networks):
+    mcn, _ = size_networks
+    mcb: MCBalance = MCBalance(mcn=mcn)
+    df_measured: pd.DataFrame = mcn.to_dataframe().drop(columns=['mass_wet'])
+    cfs: Dict = mcb._create_cost_functions()
+    for k, fn in cfs.items():
+        x: np.ndarray = df_measured.loc[k, :].values.ravel()
+        assert fn(x=x) == pytest.approx(0.0, abs=1e-6)
+
+
+def test_optimise(size_networks):
+    _, mcn_ub = size_networks
+    mcb: MCBalance = MCBalance(mcn=mcn_ub)
+    df_measured: pd.DataFrame = mcn_ub.to_dataframe().drop(columns=['mass_wet'])
+    df_res: pd.DataFrame = mcb.optimise()
+
+    pd.testing.assert_index_equal(df_res.index, df_measured.index)
+    assert list(df_res.columns) == list(df_measured.columns)
+
+    cfs: Dict = mcb._create_cost_functions()
+    for k, fn in cfs.items():
+        assert fn(x=df_res.loc[k, :].values.ravel()) < fn(x=df_measured.loc[k, :].values.ravel())
+
+
+def test_residual_jac(size_networks):
+    _, mcn_ub = size_networks
+    mcb: MCBalance = MCBalance(mcn=mcn_ub)
+    for k, args in mcb._create_cost_args().items():
+        x: np.ndarray = np.where(args[0] != 0, args[0] * 1.02, 1.0)
+        assert np.sum(residual(x, *args) ** 2) == pytest.approx(cost_fn(x, *args))
+        jac: np.ndarray = residual_jac(x, *args).toarray()
+        jac_approx: np.ndarray = approx_fprime(x, lambda z: residual(z, *args), 1e-8 * np.abs(x))
+        np.testing.assert_allclose(jac, jac_approx, rtol=1e-4, atol=1e-4)
+
+
+def test_invalidate(size_networks):
+    mcn, _ = size_networks
+    mcb: MCBalance = MCBalance(mcn=mcn)
+    df_network: pd.DataFrame = mcb._df_network
+    assert mcb._df_network is df_network
+    mcb.invalidate()
+    assert mcb._df_network is not df_network
+
+
+@pytest.mark.parametrize('use_processes', [False, True])
+def test_optimise_n_jobs(size_networks, use_processes):
+    _, mcn_ub = size_networks
+    mcb: MCBalance = MCBalance(mcn=mcn_ub)
+    df_res: pd.DataFrame = mcb.optimise()
+    df_res_jobs: pd.DataFrame = mcb.optimise(n_jobs=2, use_processes=use_processes)
+    pd.testing.assert_frame_equal(df_res_jobs, df_res, rtol=1e-3)
+
+
+def test_optimise_missing_measurement(size_assay_data):
+    mc_size: MassComposition = MassComposition(size_assay_data, name='size sample')
+    partition = partial(napier_munn, d50=0.150, ep=0.1, dim='size')
+    mc_coarse, mc_fine = mc_size.partition(definition=partition, name_1='coarse', name_2='fine')
+    df_coarse: pd.DataFrame = mc_coarse.data.to_dataframe()
+    df_coarse[['mass_wet', 'mass_dry']] = df_coarse[['mass_wet', 'mass_dry']] * 1.1
+    df_coarse.iloc[0, df_coarse.columns.get_loc('Fe')] = np.nan
+    mc_coarse_2: MassComposition = MassComposition(data=df_coarse, name='coarse').set_parent(mc_size)
+    mcn_ub: MCNetwork = MCNetwork().from_streams([mc_size, mc_coarse_2, mc_fine])
+
+    mcb: MCBalance = MCBalance(mcn=mcn_ub)
+    df_measured: pd.DataFrame = mcn_ub.to_dataframe().drop(columns=['mass_wet'])
+    df_res: pd.DataFrame = mcb.optimise()
+
+    # the missing measurement is left missing, all else is optimised
+    assert df_res.isna().equals(df_measured.isna())
+    cfs: Dict = mcb._create_cost_functions()
+    for k, fn in cfs.items():
+        assert fn(x=df_res.loc[k, :].values.ravel()) <= fn(x=df_measured.loc[k, :].values.ravel())
+
+
+
+def test_row_positions_unknown_labels(size_networks):
+    mcn, _ = size_networks
+    mcb: MCBalance = MCBalance(mcn=mcn)
+    _, records, df_measured = mcb._measured_array
+    rec_pos, strm_pos = mcb._row_positions(df_measured.index, records)
+    assert (rec_pos >= 0).all() and (strm_pos >= 0).all()
+
+    # unknown labels fail loudly, rather than addressing the last record or stream
+    size, name = df_measured.index[0]
+    for label, match in [((pd.Interval(5.0, 6.0, closed='left'), name), 'Records not found'),
+                         ((size, 'unknown'), 'Streams not found')]:
+        index: pd.MultiIndex = pd.MultiIndex.from_tuples([label], names=df_measured.index.names)
+        with pytest.raises(KeyError, match=match):
+            mcb._row_positions(index, records)
@@ -1,9 +1,15 @@
 from functools import partial
 from typing import Dict
+import warnings
 
+import numpy as np
 import pandas as pd
+import pytest
+import seaborn as sns
+from matplotlib.colors import Normalize
 
 from elphick.mass_composition.mc_network import MCNetwork
+from elphick.mass_composition.plot import comparison_plot
 from elphick.mass_composition.utils.partition import perfect
 # noinspection PyUnresolvedReferences
 from test.fixtures import demo_data, size_assay_data
@@ -26,6 +32,17 @@ def test_sankey_plot(size_assay_data):
     fig2
 
 
+def test_sankey_plot_constant_color(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+
+    mcn: MCNetwork = MCNetwork().from_streams([obj_mc, obj_mc_1, obj_mc_2])
+    # a split leaves the grade unchanged, so every edge takes the first color
+    fe: float = float(obj_mc.aggregate()['Fe'].iloc[0])
+    fig = mcn.plot_sankey(color_var='Fe', edge_colormap='viridis', vmin=fe, vmax=fe)
+    assert len(set(fig.data[0].link.color)) == 1
+
+
 def test_table_plot(demo_data):
     obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
     obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
@@ -116,3 +133,146 @@ def test_from_dataframe_wide(demo_data):
     df_res = df_res.loc[df_test.index, :]
 
     pd.testing.assert_frame_equal(df_test, df_res)
+
+
+def test_get_edge_by_name(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+
+    mcn: MCNetwork = MCNetwork().from_streams([obj_mc, obj_mc_1, obj_mc_2])
+    assert mcn.get_edge_by_name('Feed') is obj_mc
+
+    # renamed objects are found by their new name
+    obj_mc_1.name = 'product'
+    assert mcn.get_edge_by_name('product') is obj_mc_1
+    with pytest.raises(ValueError):
+        mcn.get_edge_by_name('(0.4 * Feed)')
+
+    # removed objects are no longer found
+    mcn.remove_edge(*obj_mc_2.nodes)
+    with pytest.raises(ValueError):
+        mcn.get_edge_by_name(obj_mc_2.name)
+
+
+def test_report_aggregate_cache(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+
+    mcn: MCNetwork = MCNetwork().from_streams([obj_mc, obj_mc_1, obj_mc_2])
+    rpt: pd.DataFrame = mcn.report()
+    pd.testing.assert_frame_equal(mcn.report(), rpt)
+
+    # replacing the data of an edge object invalidates its cached aggregate
+    obj_mc.set_data(obj_mc.data.to_dataframe() * 2)
+    assert mcn.report().loc['Feed', 'mass_dry'] == rpt.loc['Feed', 'mass_dry'] * 2
+
+    # as does updating the data in place
+    obj_mc_1.update_data(obj_mc_1.data['Fe'] + 10)
+    assert mcn.report().loc[obj_mc_1.name, 'Fe'] == pytest.approx(rpt.loc[obj_mc_1.name, 'Fe'] + 10)
+
+
+def test_input_output_edges(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+    obj_mc_3, obj_mc_4 = obj_mc_2.split(0.5)
+
+    mcn: MCNetwork = MCNetwork().from_streams([obj_mc, obj_mc_1, obj_mc_2, obj_mc_3, obj_mc_4])
+    assert [mc.name for mc in mcn.get_input_edges()] == ['Feed']
+    assert sorted(mc.name for mc in mcn.get_output_edges()) == sorted([obj_mc_1.name, obj_mc_3.name,
+                                                                       obj_mc_4.name])
+
+
+def test_layout_cache(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+
+    mcn: MCNetwork = MCNetwork().from_streams([obj_mc, obj_mc_1, obj_mc_2])
+    pos: Dict = mcn._get_layout(orientation='horizontal')
+    assert mcn._get_layout(orientation='horizontal') is pos
+    assert mcn._get_layout(orientation='vertical') is not pos
+
+    mcn.remove_node(obj_mc_2.nodes[1])
+    assert mcn._get_layout(orientation='horizontal') is not pos
+
+
+def test_status(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+
+    mcn: MCNetwork = MCNetwork().from_streams([obj_mc, obj_mc_1, obj_mc_2])
+    assert mcn.balanced
+    assert mcn.is_edge_status_ok
+    assert mcn.edge_status == (True, {})
+
+
+def test_plot_title(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+
+    mcn: MCNetwork = MCNetwork(name='Flowsheet').from_streams([obj_mc, obj_mc_1, obj_mc_2])
+    assert mcn._plot_title(html=False) == 'Flowsheet\nBalanced: True\nEdge Status OK: True'
+
+    # the cached status is refreshed when edge data is replaced
+    df_1: pd.DataFrame = obj_mc_1.data.to_dataframe()
+    df_mass: pd.DataFrame = df_1[['mass_wet', 'mass_dry']].copy()
+    df_1[['mass_wet', 'mass_dry']] = df_1[['mass_wet', 'mass_dry']] * 2
+    obj_mc_1.set_data(df_1)
+    assert mcn._plot_title(html=False) == 'Flowsheet\nBalanced: False\nEdge Status OK: True'
+
+    # and when edge data is updated in place
+    obj_mc_1.update_data(df_mass)
+    assert mcn._plot_title(html=False) == 'Flowsheet\nBalanced: True\nEdge Status OK: True'
+
+
+def test_comparison_plot_data_unchanged():
+    df_plot: pd.DataFrame = pd.DataFrame({'variable': ['Fe', 'Fe', 'SiO2', 'SiO2'],
+                                          'in': [60.0, 62.0, 5.0, 6.0],
+                                          'out': [61.0, 62.5, 4.0, 6.0]})
+    df_original: pd.DataFrame = df_plot.copy()
+    fig = comparison_plot(data=df_plot, x='in', y='out')
+    pd.testing.assert_frame_equal(df_plot, df_original)
+    assert list(fig.data[0].customdata.ravel()) == [-1.0, -0.5]
+
+
+def test_colors_from_floats():
+    vals: np.ndarray = np.array([40.0, 50.0, 60.0, 69.99, 80.0])
+    cmap = sns.color_palette('viridis', as_cmap=True)
+    colors = MCNetwork._colors_from_floats(50, 70, vals, cmap)
+    # values outside the range are clipped to the end colors
+    assert colors[0] == colors[1] == tuple(cmap.colors[0])
+    assert colors[2] == tuple(cmap.colors[128])
+    assert colors[3] == colors[4] == tuple(cmap.colors[255])
+    assert [MCNetwork._color_from_float(50, 70, v, cmap) for v in vals] == colors
+
+    # a constant color variable maps to the first color, and missing values to the bad color, without warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        colors = MCNetwork._colors_from_floats(50, 50, np.array([50.0, 50.0, np.nan, np.inf]), cmap)
+    assert colors[0] == colors[1] == tuple(cmap.colors[0])
+    assert colors[2] == colors[3] == tuple(cmap(np.nan)[:3])
+
+    cmap = sns.color_palette('copper_r', as_cmap=True)
+    colors = MCNetwork._colors_from_floats(50, 70, vals, cmap)
+    expected = [tuple(rgba) for rgba in cmap(Normalize(vmin=50, vmax=70)(vals), bytes=True).tolist()]
+    assert colors == expected
+
+
+def test_plot_network_edge_traces(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='Feed')
+    obj_mc_1, obj_mc_2 = obj_mc.split(0.4)
+
+    mcn: MCNetwork = MCNetwork().from_streams([obj_mc, obj_mc_1, obj_mc_2])
+    fig = mcn.plot_network()
+    # the edges share a single line trace, followed by the node and edge annotation traces
+    assert len(fig.data) == 3
+    edge_trace = fig.data[0]
+    assert len(edge_trace.x) == 3 * mcn.number_of_edges()
+    assert list(edge_trace.text[:3]) == ['Feed', 'Feed', None]
+    assert np.isnan(edge_trace.x[2])
+
+    # an edge that fails its status after an in place update is drawn in red
+    obj_mc_1.update_data(obj_mc_1.data['Fe'] + 100)
+    assert not obj_mc_1.status.ok
+    fig = mcn.plot_network()
+    assert [trace.line.color for trace in fig.data[:2]] == ['grey', 'red']
+    assert fig.data[1].text[0] == obj_mc_1.name
@@ -51,3 +51,15 @@ def test_missing_sizes(size_assay_data):
     df_expected: pd.DataFrame = pd.DataFrame.from_dict(d_expected)
     df_expected.index.names = ['size']
     pd.testing.assert_frame_equal(df_expected, df_test)
+
+
+def test_missing_intermediate_sizes(size_assay_data):
+    mc_feed: MassComposition = MassComposition(size_assay_data, name='FEED')
+    partition = partial(napier_munn, d50=0.150, ep=0.05, dim='size')
+    mc_oversize, mc_undersize = mc_feed.partition(definition=partition, name_1='OS', name_2='US')
+    # drop a coarse and an intermediate fraction - the latter cannot (yet) be aligned
+    df_fine: pd.DataFrame = mc_undersize.data.to_dataframe()
+    mc_undersize.set_data(df_fine.drop(index=[df_fine.index[0], df_fine.index[3]]))
+
+    with pytest.raises(NotImplementedError):
+        MCNetwork().from_streams([mc_feed, mc_oversize, mc_undersize])
@@ -46,3 +46,13 @@ def test_query_network(demo_data):
 
     pd.testing.assert_frame_equal(df_expected, df_report)
 
+
+def test_query_network_source_unchanged(demo_data):
+    obj_mc: MassComposition = MassComposition(demo_data, name='demo')
+    obj_one, obj_two = obj_mc.split(fraction=0.6, name_1='one', name_2='two')
+    mcn: MCNetwork = MCNetwork.from_streams([obj_mc, obj_one, obj_two], name='Network')
+    df_report: pd.DataFrame = mcn.report()
+
+    mcn.query(mc_name='demo', queries={'index': 'Fe>58'})
+    pd.testing.assert_frame_equal(mcn.report(), df_report)
+    assert obj_one.data.sizes['index'] == 3